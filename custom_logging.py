@@ -1,4 +1,18 @@
+import atexit
 import logging
+import logging.handlers
+import queue
 
-logging.basicConfig(level=logging.INFO)
+# Records are queued by the calling thread and written out by a background
+# listener, so log I/O stays off the request path
+log_queue = queue.SimpleQueue()
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+listener = logging.handlers.QueueListener(log_queue, stream_handler)
+
+root_logger = logging.getLogger()
+root_logger.setLevel(logging.INFO)
+root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+listener.start()
+atexit.register(listener.stop)
 logger = logging.getLogger(__name__)
@@ -1,26 +1,52 @@
 import logging
-from fastapi import FastAPI, HTTPException, Depends
-from pydantic import BaseModel, IPvAnyAddress
+from fastapi import FastAPI, HTTPException, Depends, Request
+from pydantic import BaseModel, field_validator
 from typing import List, Optional
 from sdk import Client
-from sqlalchemy.orm import Session
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from jose import JWTError, jwt
+from sdk.exceptions import AuthenticationError
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
+from fastapi.security import OAuth2PasswordRequestForm
+from jose import JWTError, jwk, jwt
 import uvicorn
 import datetime
-from sqlalchemy import create_engine, Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, delete, event, insert
+from sqlalchemy.ext.asyncio import async_scoped_session, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from dotenv import load_dotenv
+from asyncio import current_task
+from contextlib import asynccontextmanager
+from cachetools import TTLCache
+import hashlib
+import ipaddress
 import os
+import re
+import threading
+import time
+import custom_logging  # noqa: F401 - configures queue-based logging
 
 # Load environment variables from .env file
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Create a base class for declarative class definitions in SQLAlchemy
 Base = declarative_base()
 
 
+def utc_now():
+    """Return the current UTC time as a naive datetime.
+
+    Timestamps are stored without a timezone, so the tzinfo is dropped to
+    match what is read back from the database.
+
+    Returns:
+        datetime: The current UTC time.
+    """
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
 class VM(Base):
     """SQLAlchemy ORM model representing a Virtual Machine (VM).
 
@@ -44,31 +70,117 @@ class VM(Base):
     disk_size = Column(Integer, nullable=False)
     public_ip = Column(String, nullable=True)  # Store as string
     status = Column(String, nullable=False)
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.datetime.utcnow,
-                        onupdate=datetime.datetime.utcnow)
+    # Defaults are a fallback; create_vm sets both timestamps from one clock read
+    created_at = Column(DateTime, default=utc_now)
+    updated_at = Column(DateTime, default=utc_now, onupdate=utc_now)
 
 
 # Database setup
-# Create a SQLite engine
-engine = create_engine('sqlite:///vms.db')
-# Create all tables in the database
-Base.metadata.create_all(engine)
-# Create a configured "Session" class
-Session = sessionmaker(bind=engine)
-
-# Create a FastAPI instance
-app = FastAPI()
+# Database URL, overridable so tests can point at a separate database
+DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite+aiosqlite:///vms.db')
+# Create an async SQLite engine so DB round-trips don't block the event loop.
+# aiosqlite defaults to NullPool for file databases, which opens a new
+# connection per session, so use a sized queue pool instead.
+engine = create_async_engine(
+    DATABASE_URL,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=int(os.getenv('DB_POOL_SIZE', 20)),
+    max_overflow=int(os.getenv('DB_MAX_OVERFLOW', 10)),
+    pool_timeout=30,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+)
+
+if engine.dialect.name == 'sqlite':
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_conn, _):
+        """Tune each new SQLite connection for the write-heavy VM endpoints.
+
+        WAL with synchronous=NORMAL needs a single fsync per commit and lets
+        readers run while a write is in progress.
+
+        Args:
+            dbapi_conn: The raw DBAPI connection that was just opened.
+            _: The connection pool record (unused).
+        """
+        cursor = dbapi_conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")  # 256 MB
+        cursor.close()
+
+
+# Create a configured "AsyncSession" class
+SessionFactory = async_sessionmaker(
+    engine, expire_on_commit=False, autoflush=False)
+# Scope sessions to the current asyncio task, i.e. one per request
+SessionLocal = async_scoped_session(SessionFactory, scopefunc=current_task)
+
+# Create a FastAPI instance that encodes responses with orjson
+app = FastAPI(default_response_class=ORJSONResponse)
+# Compress responses large enough to benefit from it
+app.add_middleware(GZipMiddleware, minimum_size=500, compresslevel=5)
+
+
+@app.on_event("startup")
+async def create_tables():
+    """Create all tables in the database on application startup."""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+
+@app.on_event("shutdown")
+async def dispose_engine():
+    """Close all pooled database connections on application shutdown."""
+    await engine.dispose()
+
 # Initialize the SDK client
 sdk_client = Client(api_key=os.getenv('SDK_API_KEY')
                     )  # Ensure SDK_API_KEY is used
-# Define OAuth2 password bearer scheme
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+
+
+@app.on_event("startup")
+def authenticate_sdk_client():
+    """Authenticate the SDK client once on application startup.
+
+    The client stays authenticated for the life of the process. A failure is
+    logged rather than raised so the app still starts; the VM endpoints then
+    return 503 until the API key is fixed and the app restarted.
+    """
+    try:
+        sdk_client.authenticate()
+    except AuthenticationError as e:
+        logger.error("SDK client authentication failed: %s", e)
+
+
+def require_sdk_client():
+    """Check that the SDK client authenticated on startup.
+
+    Raises:
+        HTTPException: If the SDK client is not authenticated.
+    """
+    if not sdk_client.authenticated:
+        raise HTTPException(status_code=503, detail="SDK client not authenticated")
+
 # Load secret key from environment variable, or use a default for development
 # Default for development
 SECRET_KEY = os.getenv('SECRET_KEY', 'dev_secret_key')
 # Define JWT algorithm
 ALGORITHM = "HS256"
+# Build the HMAC signing key once instead of on every encode/decode
+SIGNING_KEY = jwk.construct(SECRET_KEY, ALGORITHM)
+# Cache of decoded token subjects, keyed by the SHA-256 digest of the token,
+# so repeat requests skip the HMAC check and payload parsing
+TOKEN_CACHE_TTL = 10
+_token_cache = TTLCache(maxsize=10_000, ttl=TOKEN_CACHE_TTL)
+_token_cache_lock = threading.Lock()
+
+
+# Fast path for the common case of a dotted-quad IPv4 address
+IPV4_PATTERN = re.compile(
+    r"(?:(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)\.){3}"
+    r"(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)")
 
 
 class VMCreateRequest(BaseModel):
@@ -79,16 +191,38 @@ class VMCreateRequest(BaseModel):
         cpu_cores (int): The number of CPU cores allocated to the VM.
         memory (int): The amount of memory (in MB) allocated to the VM.
         disk_size (int): The disk size (in GB) allocated to the VM.
-        public_ip (IPvAnyAddress, optional): The public IP address assigned to the VM.
+        public_ip (str, optional): The public IP address assigned to the VM, validated as IPv4 or IPv6.
         labels (List[str], optional): A list of labels assigned to the VM.
     """
     name: str
     cpu_cores: int
     memory: int
     disk_size: int
-    public_ip: Optional[IPvAnyAddress] = None
+    public_ip: Optional[str] = None
     labels: Optional[List[str]] = None
 
+    @field_validator("public_ip")
+    @classmethod
+    def check_public_ip(cls, value: Optional[str]) -> Optional[str]:
+        """Check that public_ip is a valid IPv4 or IPv6 address.
+
+        Args:
+            value (Optional[str]): The public IP address to check.
+
+        Returns:
+            Optional[str]: The unchanged public IP address.
+
+        Raises:
+            ValueError: If the value is not a valid IP address.
+        """
+        if value is None or IPV4_PATTERN.fullmatch(value):
+            return value
+        try:
+            ipaddress.ip_address(value)
+        except ValueError:
+            raise ValueError("value is not a valid IPv4 or IPv6 address")
+        return value
+
 
 class VMResponse(BaseModel):
     """Pydantic model representing the response for a VM.
@@ -117,39 +251,97 @@ class VMResponse(BaseModel):
     updated_at: datetime.datetime
 
 
-def get_db():
-    """Dependency to provide a SQLAlchemy session to path operation functions.
+@asynccontextmanager
+async def get_db():
+    """Context manager providing the current task's SQLAlchemy session.
+
+    The session is closed and removed from the registry on exit.
 
     Yields:
-        Session: A SQLAlchemy session.
+        AsyncSession: A SQLAlchemy async session.
     """
-    db = Session()
+    db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
+        await SessionLocal.remove()
 
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
-    """Dependency to get the current user from the JWT token.
+def decode_token(token: str) -> Optional[str]:
+    """Decode a JWT token, using the cache of recently decoded tokens.
 
     Args:
         token (str): The JWT token provided by the user.
 
+    Returns:
+        Optional[str]: The user ID extracted from the token, or None if the
+        token is invalid or has no user ID.
+    """
+    key = hashlib.sha256(token.encode()).digest()
+    with _token_cache_lock:
+        cached_user_id = _token_cache.get(key)
+    if cached_user_id is not None:
+        return cached_user_id
+
+    try:
+        payload = jwt.decode(token, SIGNING_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    user_id: Optional[str] = payload.get("sub")
+    if user_id is None:
+        return None
+
+    # Don't let a cached entry outlive the token's own expiry
+    exp = payload.get("exp")
+    if exp is None or exp - time.time() > TOKEN_CACHE_TTL:
+        with _token_cache_lock:
+            _token_cache[key] = user_id
+    return user_id
+
+
+class AuthMiddleware:
+    """ASGI middleware that resolves the bearer token once per request.
+
+    The user ID is stored on ``request.state.user_id``, or None when the
+    request has no valid bearer token.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            user_id = None
+            for name, value in scope["headers"]:
+                if name == b"authorization":
+                    scheme, _, token = value.decode("latin-1").partition(" ")
+                    if scheme.lower() == "bearer" and token:
+                        user_id = decode_token(token)
+                    break
+            scope.setdefault("state", {})["user_id"] = user_id
+        await self.app(scope, receive, send)
+
+
+app.add_middleware(AuthMiddleware)
+
+
+def get_current_user(request: Request) -> str:
+    """Get the current user resolved by AuthMiddleware.
+
+    Args:
+        request (Request): The incoming request.
+
     Returns:
         str: The user ID extracted from the token.
 
     Raises:
-        HTTPException: If the token is invalid or user ID is not found.
+        HTTPException: If the token is missing, invalid or has no user ID.
     """
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid credentials")
-        return user_id
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid credentials")
+    user_id = request.state.user_id
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Invalid credentials",
+                            headers={"WWW-Authenticate": "Bearer"})
+    return user_id
 
 
 @app.post("/token")
@@ -164,115 +356,195 @@ def login(form_data: OAuth2PasswordRequestForm = Depends()):
     """
     user_id = form_data.username
     access_token = jwt.encode(
-        {"sub": user_id}, SECRET_KEY, algorithm=ALGORITHM)
+        {"sub": user_id}, SIGNING_KEY, algorithm=ALGORITHM)
     return {"access_token": access_token, "token_type": "bearer"}
 
 
-@app.post("/vms", response_model=VMResponse)
-def create_vm(request: VMCreateRequest, db: Session = Depends(get_db), current_user: str = Depends(get_current_user)):
+@app.post("/vms", responses={200: {"model": VMResponse}})
+async def create_vm(request: VMCreateRequest, http_request: Request):
     """Endpoint to create a new VM.
 
     Args:
         request (VMCreateRequest): The request body containing VM details.
-        db (Session): The SQLAlchemy session dependency.
-        current_user (str): The current user obtained from the token.
+        http_request (Request): The incoming request, carrying the current user.
 
     Returns:
-        VMResponse: The created VM object.
+        ORJSONResponse: The created VM, in the shape of VMResponse.
 
     Raises:
-        HTTPException: If there is an error creating the VM.
+        HTTPException: If the user or SDK client is not authenticated or there is an error creating the VM.
     """
+    get_current_user(http_request)
+    require_sdk_client()
     try:
-        sdk_client.authenticate()
         vm = sdk_client.create_vm(
             name=request.name,
             cpu_cores=request.cpu_cores,
             memory=request.memory,
             disk_size=request.disk_size,
-            public_ip=str(request.public_ip) if request.public_ip else None,
+            public_ip=request.public_ip,
             labels=request.labels
         )
+        # Set timestamps up front so no SELECT is needed after the INSERT
+        now = utc_now()
         new_vm = VM(
             id=vm.id,
             name=vm.name,
             cpu_cores=vm.cpu_cores,
             memory=vm.memory,
             disk_size=vm.disk_size,
-            public_ip=str(vm.public_ip) if vm.public_ip else None,
-            status='created'
+            public_ip=vm.public_ip,
+            status='created',
+            created_at=now,
+            updated_at=now
         )
 
-        # Dump values before saving to the database
-        logging.info(f"Dump new_vm before save: {new_vm.__dict__}")
-        print(f"Dump new_vm before save: {new_vm.__dict__}")
-
-        db.add(new_vm)
-        db.commit()
-        db.refresh(new_vm)
-        logging.info(f"VM created: {new_vm}")
-
-        return VMResponse(
-            id=new_vm.id,
-            name=new_vm.name,
-            cpu_cores=new_vm.cpu_cores,
-            memory=new_vm.memory,
-            disk_size=new_vm.disk_size,
-            public_ip=new_vm.public_ip,
-            labels=request.labels if request.labels else [],
-            status=new_vm.status,
-            created_at=new_vm.created_at,
-            updated_at=new_vm.updated_at
-        )
+        # Log the key values before saving to the database
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("VM to save: id=%s name=%s", new_vm.id, new_vm.name)
+
+        async with get_db() as db:
+            db.add(new_vm)
+            await db.commit()
+        logger.debug("VM created: %r", new_vm)
+
+        # Values come from the SDK and the DB, so serialize them directly
+        # rather than validating them against VMResponse again
+        return ORJSONResponse({
+            "id": new_vm.id,
+            "name": new_vm.name,
+            "cpu_cores": new_vm.cpu_cores,
+            "memory": new_vm.memory,
+            "disk_size": new_vm.disk_size,
+            "public_ip": new_vm.public_ip,
+            "labels": request.labels if request.labels else [],
+            "status": new_vm.status,
+            "created_at": new_vm.created_at,
+            "updated_at": new_vm.updated_at
+        })
     except Exception as e:
-        logging.error(f"Error creating VM: {str(e)}")
-        print(f"Error creating VM: {str(e)}")
+        logger.error("Error creating VM: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.delete("/vms/{vm_id}", response_model=VMResponse)
-def delete_vm(vm_id: str, db: Session = Depends(get_db), current_user: str = Depends(get_current_user)):
+@app.post("/vms:batch", responses={200: {"model": List[VMResponse]}})
+async def create_vms_batch(vm_requests: List[VMCreateRequest], http_request: Request):
+    """Endpoint to create several VMs in one request.
+
+    The VMs are saved with a single multi-row INSERT and one commit rather
+    than one ORM unit of work per VM.
+
+    Args:
+        vm_requests (List[VMCreateRequest]): The request body containing the details of each VM.
+        http_request (Request): The incoming request, carrying the current user.
+
+    Returns:
+        ORJSONResponse: The created VMs, each in the shape of VMResponse.
+
+    Raises:
+        HTTPException: If the user or SDK client is not authenticated or there is an error creating the VMs.
+    """
+    get_current_user(http_request)
+    require_sdk_client()
+    try:
+        now = utc_now()
+        rows = []
+        for vm_request in vm_requests:
+            vm = sdk_client.create_vm(
+                name=vm_request.name,
+                cpu_cores=vm_request.cpu_cores,
+                memory=vm_request.memory,
+                disk_size=vm_request.disk_size,
+                public_ip=vm_request.public_ip,
+                labels=vm_request.labels
+            )
+            rows.append({
+                "id": vm.id,
+                "name": vm.name,
+                "cpu_cores": vm.cpu_cores,
+                "memory": vm.memory,
+                "disk_size": vm.disk_size,
+                "public_ip": vm.public_ip,
+                "status": 'created',
+                "created_at": now,
+                "updated_at": now
+            })
+
+        if rows:
+            async with get_db() as db:
+                await db.execute(insert(VM), rows)
+                await db.commit()
+        logger.debug("VMs created: %d", len(rows))
+
+        return ORJSONResponse([
+            {**row, "labels": vm_request.labels if vm_request.labels else []}
+            for row, vm_request in zip(rows, vm_requests)
+        ])
+    except Exception as e:
+        logger.error("Error creating VMs: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.delete("/vms/{vm_id}", responses={200: {"model": VMResponse}})
+async def delete_vm(vm_id: str, http_request: Request):
     """Endpoint to delete a VM.
 
     Args:
         vm_id (str): The ID of the VM to delete.
-        db (Session): The SQLAlchemy session dependency.
-        current_user (str): The current user obtained from the token.
+        http_request (Request): The incoming request, carrying the current user.
 
     Returns:
-        VMResponse: The deleted VM object.
+        ORJSONResponse: The deleted VM, in the shape of VMResponse.
 
     Raises:
-        HTTPException: If the VM is not found or there is an error deleting the VM.
+        HTTPException: If the user or SDK client is not authenticated, the VM is not found or there is an error deleting the VM.
     """
+    get_current_user(http_request)
+    require_sdk_client()
     try:
-        sdk_client.authenticate()
         sdk_client.delete_vm(vm_id)
-        vm = db.query(VM).filter(VM.id == vm_id).first()
-        if vm is None:
-            raise HTTPException(status_code=404, detail="VM not found")
-
-        db.delete(vm)  # Delete the VM record from the database
-        db.commit()
-        logging.info(f"VM deleted: {vm}")
-
-        return VMResponse(
-            id=vm.id,
-            name=vm.name,
-            cpu_cores=vm.cpu_cores,
-            memory=vm.memory,
-            disk_size=vm.disk_size,
-            public_ip=vm.public_ip,
-            labels=[],  # Assuming labels are not needed for the delete response
-            status='deleted',  # Indicate the VM was deleted
-            created_at=vm.created_at,
-            updated_at=vm.updated_at
-        )
+        async with get_db() as db:
+            # Delete the VM record and fetch it back in a single statement
+            result = await db.execute(
+                delete(VM).where(VM.id == vm_id).returning(VM))
+            vm = result.scalar_one_or_none()
+            if vm is None:
+                raise HTTPException(status_code=404, detail="VM not found")
+
+            await db.commit()
+        logger.debug("VM deleted: %r", vm)
+
+        # Values come from the DB, so serialize them directly rather than
+        # validating them against VMResponse again
+        return ORJSONResponse({
+            "id": vm.id,
+            "name": vm.name,
+            "cpu_cores": vm.cpu_cores,
+            "memory": vm.memory,
+            "disk_size": vm.disk_size,
+            "public_ip": vm.public_ip,
+            "labels": [],  # Assuming labels are not needed for the delete response
+            "status": 'deleted',  # Indicate the VM was deleted
+            "created_at": vm.created_at,
+            "updated_at": vm.updated_at
+        })
+    except HTTPException:
+        raise
     except Exception as e:
-        logging.error(f"Error deleting VM: {str(e)}")
+        logger.error("Error deleting VM: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 if __name__ == "__main__":
-    # Run the FastAPI app using Uvicorn server
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Run the FastAPI app using Uvicorn server with uvloop and the httptools
+    # parser. Workers need the app as an import string.
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv('WEB_CONCURRENCY', 4)),
+        limit_concurrency=1000,
+        timeout_keep_alive=30,
+    )
@@ -56,16 +56,16 @@ class Client:
         if not self.authenticated:
             raise AuthenticationError("Not authenticated")
 
-        if random.randint(1, 100) == 1:
+        if random.random() < 0.01:
             # simulate no resources 1% of the time
             raise NoResourcesAvailableError(
                 "No resources available to create a new virtual machine"
             )
 
-        vm_id = f"{uuid4()}"
-        logger.info(f"Creating VM with ID {vm_id}")
+        vm_id = uuid4().hex
+        logger.info("Creating VM with ID %s", vm_id)
 
-        return VirtualMachine(
+        return VirtualMachine.model_construct(
             id=vm_id,
             name=name,
             cpu_cores=cpu_cores,
@@ -88,5 +88,5 @@ class Client:
         if not self.authenticated:
             raise AuthenticationError("Not authenticated")
 
-        logger.info(f"Deleting VM with ID {vm_id}")
+        logger.info("Deleting VM with ID %s", vm_id)
         return True
@@ -1,11 +1,16 @@
-from pydantic import BaseModel, Field, IPvAnyAddress
+from pydantic import BaseModel, ConfigDict, Field, IPvAnyAddress
 
 
 class VirtualMachine(BaseModel):
     """
     An object to represent a virtual machine
+
+    Instances are immutable. The client builds them with model_construct,
+    skipping validation of values it has already checked.
     """
 
+    model_config = ConfigDict(frozen=True)
+
     id: str
     name: str
     cpu_cores: int
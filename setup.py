@@ -0,0 +1,24 @@
+"""Optional C-extension build for the SDK.
+
+Compiles the SDK client and models with Cython:
+
+    python setup.py build_ext --inplace
+
+The compiled modules are placed next to the sources and take precedence on
+import. Without them the pure-Python modules are used unchanged.
+"""
+from Cython.Build import cythonize
+from setuptools import Extension, setup
+
+# Module names are given explicitly because the repository root is itself a
+# package, which would otherwise be prepended to them
+extensions = [
+    Extension("sdk.client", ["sdk/client.py"]),
+    Extension("sdk.models", ["sdk/models.py"]),
+]
+
+setup(
+    name="techtest-sdk",
+    ext_modules=cythonize(
+        extensions, compiler_directives={"language_level": 3}),
+)
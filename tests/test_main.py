@@ -1,44 +1,93 @@
+import os
 import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import patch, MagicMock
-from main import app, get_db, Base, engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import select, text
 import uuid
+from pydantic import ValidationError
 
-# Setup the test database
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Setup the test database before main creates its engine
+SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./test.db"
+os.environ["DATABASE_URL"] = SQLALCHEMY_DATABASE_URL
+# The SDK client authenticates on startup, so it needs an API key
+os.environ["SDK_API_KEY"] = os.environ.get("SDK_API_KEY") or "test-api-key"
+
+from jose import jwt  # noqa: E402
+import main  # noqa: E402
+from main import app, Base, SessionFactory, VM, VMCreateRequest, VMResponse, engine, decode_token, SECRET_KEY, ALGORITHM  # noqa: E402
+
+
+async def drop_tables():
+    """Drop all tables in the database."""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
 
 
 @pytest.fixture(scope="module")
 def test_app():
     """Creates a TestClient instance and sets up the test database schema.
 
-    This fixture initializes the database schema before the tests are run
-    and yields a FastAPI TestClient for making API requests. After the tests
-    are completed, it tears down the database schema.
+    This fixture runs the application startup handlers, which initialize the
+    database schema, and yields a FastAPI TestClient for making API requests.
+    After the tests are completed, it tears down the database schema and runs
+    the shutdown handlers, which dispose of the engine.
 
     Yields:
         TestClient: A FastAPI TestClient instance.
     """
-    Base.metadata.create_all(bind=engine)
-    yield TestClient(app)
-    Base.metadata.drop_all(bind=engine)
+    with TestClient(app) as client:
+        yield client
+        client.portal.call(drop_tables)
 
 
 @pytest.fixture(scope="module")
-def db():
-    """Provides a SQLAlchemy session for database operations.
+def db(test_app):
+    """Provides a SQLAlchemy async session for database operations.
 
     This fixture creates a new SQLAlchemy session for the duration of the test module.
-    The session is closed after the tests are completed.
+    The session runs on the TestClient event loop and is closed after the tests
+    are completed.
 
     Yields:
-        Session: A SQLAlchemy session.
+        AsyncSession: A SQLAlchemy async session.
     """
-    db = SessionLocal()
+    db = SessionFactory()
     yield db
-    db.close()
+    test_app.portal.call(db.close)
+
+
+def db_scalar(test_app, db, statement):
+    """Run a statement on the db fixture and return the first column.
+
+    The transaction is rolled back afterwards so later reads are not served
+    from a stale WAL snapshot.
+
+    Args:
+        test_app (TestClient): The FastAPI TestClient fixture.
+        db (AsyncSession): The SQLAlchemy async session fixture.
+        statement: The SQL statement to execute.
+
+    Returns:
+        The first column of the first result row, or None.
+    """
+    try:
+        return test_app.portal.call(db.scalar, statement)
+    finally:
+        test_app.portal.call(db.rollback)
+
+
+def get_vm_status(test_app, db, vm_id):
+    """Fetch a VM's status directly from the database.
+
+    Args:
+        test_app (TestClient): The FastAPI TestClient fixture.
+        db (AsyncSession): The SQLAlchemy async session fixture.
+        vm_id (str): The ID of the VM to fetch.
+
+    Returns:
+        str: The stored VM status, or None if the VM does not exist.
+    """
+    return db_scalar(test_app, db, select(VM.status).where(VM.id == vm_id))
 
 
 def mock_authenticate(self):
@@ -87,6 +136,35 @@ def mock_delete_vm(self, vm_id):
     return True
 
 
+def test_sqlite_pragmas(test_app, db):
+    """Test case for the SQLite connection pragmas.
+
+    Args:
+        test_app (TestClient): The FastAPI TestClient fixture.
+        db (AsyncSession): The SQLAlchemy async session fixture.
+
+    Asserts:
+        The database runs in WAL mode with synchronous=NORMAL.
+    """
+    assert db_scalar(test_app, db, text("PRAGMA journal_mode")) == "wal"
+    # synchronous=NORMAL is reported as 1
+    assert db_scalar(test_app, db, text("PRAGMA synchronous")) == 1
+
+
+def test_gzip_response(test_app):
+    """Test case for response compression.
+
+    Args:
+        test_app (TestClient): The FastAPI TestClient fixture.
+
+    Asserts:
+        Large responses are gzip-encoded when the client accepts it.
+    """
+    response = test_app.get("/openapi.json", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+
+
 @patch('sdk.Client.authenticate', mock_authenticate)
 @patch('sdk.Client.create_vm', mock_create_vm)
 @patch('sdk.Client.delete_vm', mock_delete_vm)
@@ -99,11 +177,13 @@ def test_create_vm(test_app, db):
 
     Args:
         test_app (TestClient): The FastAPI TestClient fixture.
-        db (Session): The SQLAlchemy session fixture.
+        db (AsyncSession): The SQLAlchemy async session fixture.
 
     Asserts:
         The status code of the response is 200.
         The response contains the expected VM name and status.
+        The response matches the VMResponse schema.
+        The VM is saved to the database.
     """
     response = test_app.post(
         "/token", data={"username": "testuser", "password": "testpassword"})
@@ -116,6 +196,46 @@ def test_create_vm(test_app, db):
     data = response.json()
     assert data["name"] == "test-vm"
     assert data["status"] == "created"
+    assert data["created_at"] == data["updated_at"]
+    assert set(data) == set(VMResponse.model_fields)
+    VMResponse.model_validate(data)
+    assert get_vm_status(test_app, db, data["id"]) == "created"
+
+
+@patch('sdk.Client.create_vm', mock_create_vm)
+def test_create_vms_batch(test_app, db):
+    """Test case for creating several VMs in one request.
+
+    Args:
+        test_app (TestClient): The FastAPI TestClient fixture.
+        db (AsyncSession): The SQLAlchemy async session fixture.
+
+    Asserts:
+        The status code of the response is 200.
+        The response contains one created VM per requested VM, in order.
+        Every VM is saved to the database.
+    """
+    response = test_app.post(
+        "/token", data={"username": "testuser", "password": "testpassword"})
+    token = response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    body = [
+        {"name": f"batch-vm-{i}", "cpu_cores": 2, "memory": 4096, "disk_size": 50, "labels": [f"batch-{i}"]}
+        for i in range(3)
+    ]
+    response = test_app.post("/vms:batch", json=body, headers=headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert [vm["name"] for vm in data] == ["batch-vm-0", "batch-vm-1", "batch-vm-2"]
+    assert [vm["labels"] for vm in data] == [["batch-0"], ["batch-1"], ["batch-2"]]
+    for vm in data:
+        VMResponse.model_validate(vm)
+        assert get_vm_status(test_app, db, vm["id"]) == "created"
+
+    response = test_app.post("/vms:batch", json=[], headers=headers)
+    assert response.status_code == 200
+    assert response.json() == []
 
 
 @patch('sdk.Client.authenticate', mock_authenticate)
@@ -130,12 +250,13 @@ def test_delete_vm(test_app, db):
 
     Args:
         test_app (TestClient): The FastAPI TestClient fixture.
-        db (Session): The SQLAlchemy session fixture.
+        db (AsyncSession): The SQLAlchemy async session fixture.
 
     Asserts:
         The status code of the VM creation response is 200.
         The status code of the VM deletion response is 200.
         The response contains the expected VM status.
+        The VM is removed from the database.
     """
     response = test_app.post(
         "/token", data={"username": "testuser", "password": "testpassword"})
@@ -151,3 +272,140 @@ def test_delete_vm(test_app, db):
     assert response.status_code == 200
     data = response.json()
     assert data["status"] == "deleted"
+    assert data["id"] == vm_id
+    assert data["name"] == "test-vm"
+    assert get_vm_status(test_app, db, vm_id) is None
+    # Request-scoped sessions are removed from the registry once used
+    assert main.SessionLocal.registry.registry == {}
+
+
+@patch('sdk.Client.authenticate', mock_authenticate)
+@patch('sdk.Client.delete_vm', mock_delete_vm)
+def test_delete_vm__not_found(test_app):
+    """Test case for deleting a VM that does not exist.
+
+    Args:
+        test_app (TestClient): The FastAPI TestClient fixture.
+
+    Asserts:
+        The status code of the VM deletion response is 404.
+    """
+    response = test_app.post(
+        "/token", data={"username": "testuser", "password": "testpassword"})
+    token = response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = test_app.delete(f"/vms/{uuid.uuid4()}", headers=headers)
+    assert response.status_code == 404
+    assert response.json()["detail"] == "VM not found"
+
+
+def test_login__token_signed_with_secret_key(test_app):
+    """Test case for the token endpoint.
+
+    Args:
+        test_app (TestClient): The FastAPI TestClient fixture.
+
+    Asserts:
+        The issued token verifies against the raw secret key.
+    """
+    response = test_app.post(
+        "/token", data={"username": "testuser", "password": "testpassword"})
+    token = response.json()["access_token"]
+    assert jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]) == {"sub": "testuser"}
+
+
+def test_decode_token__caches_decoded_token():
+    """Test case for the decoded token cache.
+
+    Asserts:
+        A token is only decoded once across repeated lookups.
+    """
+    token = jwt.encode({"sub": f"user-{uuid.uuid4()}"}, SECRET_KEY, algorithm=ALGORITHM)
+    with patch("main.jwt.decode", wraps=jwt.decode) as mock_decode:
+        assert decode_token(token) == decode_token(token)
+    assert mock_decode.call_count == 1
+
+
+def test_decode_token__invalid_token():
+    """Test case for an invalid token.
+
+    Asserts:
+        No user ID is returned, on every attempt.
+    """
+    for _ in range(2):
+        assert decode_token("not-a-jwt") is None
+
+
+def test_create_vm__unauthenticated(test_app):
+    """Test case for creating a VM without valid credentials.
+
+    Args:
+        test_app (TestClient): The FastAPI TestClient fixture.
+
+    Asserts:
+        The status code is 401 with no token, an invalid token or a non-bearer scheme.
+    """
+    body = {"name": "test-vm", "cpu_cores": 2, "memory": 4096, "disk_size": 50}
+    for headers in ({}, {"Authorization": "Bearer not-a-jwt"}, {"Authorization": "Basic dXNlcjpwYXNz"}):
+        response = test_app.post("/vms", json=body, headers=headers)
+        assert response.status_code == 401
+
+
+def test_authenticate_sdk_client__invalid_api_key():
+    """Test case for a failed SDK client authentication on startup.
+
+    Asserts:
+        The failure is logged rather than raised.
+    """
+    with patch.object(main, "sdk_client", main.Client(api_key=None)) as sdk_client:
+        main.authenticate_sdk_client()
+        assert sdk_client.authenticated is False
+
+
+def test_create_vm__sdk_client_not_authenticated(test_app):
+    """Test case for creating a VM when the SDK client is not authenticated.
+
+    Args:
+        test_app (TestClient): The FastAPI TestClient fixture.
+
+    Asserts:
+        The status code of the response is 503.
+    """
+    response = test_app.post(
+        "/token", data={"username": "testuser", "password": "testpassword"})
+    token = response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    with patch.object(main, "sdk_client", main.Client(api_key=None)):
+        response = test_app.post(
+            "/vms", json={"name": "test-vm", "cpu_cores": 2, "memory": 4096, "disk_size": 50}, headers=headers)
+    assert response.status_code == 503
+
+
+@pytest.mark.parametrize("public_ip", [None, "192.168.1.1", "0.0.0.0", "2001:db8::1"])
+def test_vm_create_request__valid_public_ip(public_ip):
+    """Test case for valid public IP addresses.
+
+    Args:
+        public_ip (str): The public IP address to validate.
+
+    Asserts:
+        The public IP address is kept unchanged.
+    """
+    request = VMCreateRequest(name="test-vm", cpu_cores=2, memory=4096, disk_size=50, public_ip=public_ip)
+    assert request.public_ip == public_ip
+
+
+@pytest.mark.parametrize("public_ip", ["", "256.1.1.1", "1.2.3", "01.2.3.4x", "not-an-ip"])
+def test_vm_create_request__invalid_public_ip(public_ip):
+    """Test case for invalid public IP addresses.
+
+    Args:
+        public_ip (str): The public IP address to validate.
+
+    Asserts:
+        A ValidationError is raised.
+    """
+    with pytest.raises(ValidationError):
+        VMCreateRequest(name="test-vm", cpu_cores=2, memory=4096, disk_size=50, public_ip=public_ip)
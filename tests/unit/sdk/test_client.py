@@ -2,6 +2,8 @@ import pytest
 
 from unittest.mock import patch
 
+from pydantic import ValidationError
+
 from sdk import Client
 from sdk.exceptions import AuthenticationError, NoResourcesAvailableError
 from sdk.models import VirtualMachine
@@ -19,9 +21,10 @@ def test_authenticate__without_api_key():
         client.authenticate()
 
 
-@patch("sdk.client.uuid4", return_value="uuid4")
-@patch("sdk.client.random.randint", return_value=0)
-def test_create_vm(mock_randint, mock_uuid4):
+@patch("sdk.client.uuid4")
+@patch("sdk.client.random.random", return_value=0.5)
+def test_create_vm(mock_random, mock_uuid4):
+    mock_uuid4.return_value.hex = "uuid4"
     client = Client(api_key="1234")
     client.authenticate()
     vm = client.create_vm(name="my-vm", cpu_cores=1, memory=512, disk_size=10)
@@ -35,8 +38,21 @@ def test_create_vm(mock_randint, mock_uuid4):
     )
 
 
-@patch("sdk.client.random.randint", return_value=1)
-def test_create_vm__fails_with_no_resources_available(mock_randint):
+@patch("sdk.client.random.random", return_value=0.5)
+def test_create_vm__is_frozen(mock_random):
+    client = Client(api_key="1234")
+    client.authenticate()
+    vm = client.create_vm(
+        name="my-vm", cpu_cores=1, memory=512, disk_size=10, public_ip="10.0.0.1"
+    )
+
+    assert vm.public_ip == "10.0.0.1"
+    with pytest.raises(ValidationError):
+        vm.name = "other-vm"
+
+
+@patch("sdk.client.random.random", return_value=0.0)
+def test_create_vm__fails_with_no_resources_available(mock_random):
     client = Client(api_key="1234")
     client.authenticate()
 